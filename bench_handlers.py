@@ -0,0 +1,263 @@
+"""Офлайн мікро-бенчмарки обробки вхідних оновлень.
+
+Будує синтетичні об'єкти Update і викликає обробники SimpleBroadcastBot
+напряму з фейковим ботом, без мережі. Для кожного сценарію вимірюється
+затримка на одне оновлення та обсяг алокацій (tracemalloc): піковий
+приріст пам'яті під час обробки і скільки з неї залишилось після.
+
+Розмір даних задається трьома осями, кожна з яких впливає на вхідний шлях:
+кількість груп (трафік group_chatter), розмір списку адмінів (сканування в
+is_admin на кожне оновлення) і кількість збережених повідомлень
+(/list_messages, /status і запис messages.json при додаванні). Сценарій
+admins_repair щоразу підкладає self.admins не списком, тож вимірюється
+гілка is_admin -> save_data('admins').
+
+Запуск:
+    python bench_handlers.py [--groups 10 1000] [--admins 1 1000] [--messages 0 100] [--updates 1000]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+from telegram import Chat, Message, PhotoSize, Update, User
+
+import main
+
+BENCH_TOKEN = "123456:BENCHMARK-OFFLINE-TOKEN"
+ADMIN_ID = 1000
+USER_ID = 2000
+
+
+class FakeFile:
+    """Замінник telegram.File, що віддає фото без завантаження"""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def download_as_bytearray(self, *args, **kwargs):
+        return bytearray(self.data)
+
+
+class FakeBot:
+    """Бот-заглушка: рахує виклики API замість мережевих запитів"""
+
+    def __init__(self):
+        self.calls = 0
+        self.photo_bytes = b"\xff\xd8\xff" + b"\x00" * 4096
+
+    async def send_message(self, *args, **kwargs):
+        self.calls += 1
+
+    async def get_file(self, *args, **kwargs):
+        self.calls += 1
+        return FakeFile(self.photo_bytes)
+
+
+def make_update(update_id, bot, user_id, chat, text=None, photo=False):
+    """Створення синтетичного Update з прив'язаним фейковим ботом"""
+    user = User(id=user_id, first_name="bench", is_bot=False)
+    photo_sizes = ()
+    if photo:
+        photo_sizes = (PhotoSize(file_id="bench", file_unique_id="bench", width=800, height=600),)
+        for size in photo_sizes:
+            size.set_bot(bot)
+
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=chat,
+        from_user=user,
+        text=text,
+        photo=photo_sizes,
+    )
+    message.set_bot(bot)
+    return Update(update_id=update_id, message=message)
+
+
+def make_context(args=None):
+    """Мінімальний контекст: обробники використовують лише user_data та args"""
+    return SimpleNamespace(user_data={}, args=args or [])
+
+
+def make_bot(group_count, admin_count, message_count):
+    """SimpleBroadcastBot з даними в пам'яті та фейковим API"""
+    bot = main.SimpleBroadcastBot(BENCH_TOKEN)
+    # Справжній адмін в кінці списку - найгірший випадок для сканування в is_admin
+    bot.admins = [str(ADMIN_ID + 1 + i) for i in range(admin_count - 1)] + [str(ADMIN_ID)]
+    bot.messages = [
+        {
+            'id': i + 1,
+            'text': f"Рекламне повідомлення {i} " + "текст " * 40,
+            'photo_base64': None,
+            'has_photo': False,
+            'created_date': datetime.now().isoformat(),
+            'created_by': ADMIN_ID
+        }
+        for i in range(message_count)
+    ]
+    bot.groups = [
+        {'chat_id': -1000000000000 - i, 'title': f"Group {i}", 'added_date': datetime.now().isoformat()}
+        for i in range(group_count)
+    ]
+    return bot
+
+
+def scenario_group_chatter(bot, fake_bot, count):
+    """Звичайні текстові повідомлення та фото учасників у зареєстрованих групах"""
+    jobs = []
+    for i in range(count):
+        group = bot.groups[i % len(bot.groups)]
+        chat = Chat(id=group['chat_id'], type=Chat.SUPERGROUP, title=group['title'])
+        if i % 5 == 0:
+            update = make_update(i, fake_bot, USER_ID + i, chat, photo=True)
+            jobs.append((bot.handle_photo, update, make_context()))
+        else:
+            update = make_update(i, fake_bot, USER_ID + i, chat, text=f"message {i}")
+            jobs.append((bot.handle_text, update, make_context()))
+    return jobs
+
+
+def scenario_admin_commands(bot, fake_bot, count):
+    """Команди адміна в приватному чаті"""
+    chat = Chat(id=ADMIN_ID, type=Chat.PRIVATE)
+    handlers = (bot.status, bot.list_messages, bot.start)
+    jobs = []
+    for i in range(count):
+        update = make_update(i, fake_bot, ADMIN_ID, chat, text="/command")
+        jobs.append((handlers[i % len(handlers)], update, make_context()))
+    return jobs
+
+
+def scenario_add_message(bot, fake_bot, count):
+    """Повний цикл /add_message -> текст -> фото (або /skip_photo)"""
+    chat = Chat(id=ADMIN_ID, type=Chat.PRIVATE)
+    jobs = []
+    for i in range(count // 3):
+        context = make_context()
+        base = i * 3
+        jobs.append((bot.add_message, make_update(base, fake_bot, ADMIN_ID, chat, text="/add_message"), context))
+        jobs.append((bot.handle_text, make_update(base + 1, fake_bot, ADMIN_ID, chat, text=f"Рекламний текст {i}"), context))
+        if i % 2 == 0:
+            jobs.append((bot.handle_photo, make_update(base + 2, fake_bot, ADMIN_ID, chat, photo=True), context))
+        else:
+            jobs.append((bot.skip_photo, make_update(base + 2, fake_bot, ADMIN_ID, chat, text="/skip_photo"), context))
+    return jobs
+
+
+def scenario_admins_repair(bot, fake_bot, count):
+    """Групові повідомлення, коли admins.json містить одне значення, а не список"""
+
+    async def handle_with_scalar_admins(update, context):
+        bot.admins = str(ADMIN_ID)
+        await bot.handle_text(update, context)
+
+    jobs = []
+    for i in range(count):
+        group = bot.groups[i % len(bot.groups)]
+        chat = Chat(id=group['chat_id'], type=Chat.SUPERGROUP, title=group['title'])
+        update = make_update(i, fake_bot, USER_ID + i, chat, text=f"message {i}")
+        jobs.append((handle_with_scalar_admins, update, make_context()))
+    return jobs
+
+
+SCENARIOS = {
+    'group_chatter': scenario_group_chatter,
+    'admin_commands': scenario_admin_commands,
+    'add_message': scenario_add_message,
+    'admins_repair': scenario_admins_repair,
+}
+
+
+async def run_jobs(jobs):
+    for handler, update, context in jobs:
+        await handler(update, context)
+
+
+async def run_jobs_traced(jobs):
+    """Прогін з підрахунком пікових і утриманих байтів на кожне оновлення"""
+    peak_total = 0
+    retained_total = 0
+    for handler, update, context in jobs:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await handler(update, context)
+        current, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - before
+        retained_total += current - before
+    return peak_total, retained_total
+
+
+def run_scenario(name, group_count, admin_count, message_count, update_count):
+    """Прогін одного сценарію: спочатку час, потім алокації окремим проходом"""
+    fake_bot = FakeBot()
+    timing_bot = make_bot(group_count, admin_count, message_count)
+    jobs = SCENARIOS[name](timing_bot, fake_bot, update_count)
+    start = time.perf_counter()
+    asyncio.run(run_jobs(jobs))
+    elapsed = time.perf_counter() - start
+    api_calls = fake_bot.calls
+
+    alloc_bot = make_bot(group_count, admin_count, message_count)
+    jobs = SCENARIOS[name](alloc_bot, FakeBot(), update_count)
+    tracemalloc.start()
+    peak_total, retained_total = asyncio.run(run_jobs_traced(jobs))
+    tracemalloc.stop()
+
+    processed = len(jobs)
+    return {
+        'scenario': name,
+        'groups': group_count,
+        'admins': admin_count,
+        'messages': message_count,
+        'updates': processed,
+        'us_per_update': elapsed / processed * 1e6,
+        'peak_bytes_per_update': peak_total / processed,
+        'retained_bytes_per_update': retained_total / processed,
+        'api_calls': api_calls,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Офлайн бенчмарки обробників оновлень")
+    parser.add_argument('--groups', type=int, nargs='+', default=[10, 1000])
+    parser.add_argument('--admins', type=int, nargs='+', default=[1, 1000])
+    parser.add_argument('--messages', type=int, nargs='+', default=[0, 100])
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), nargs='+', default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    # Обробники логують і зберігають файли - ізолюємо бенчмарк від робочих даних
+    logging.disable(logging.CRITICAL)
+    original_cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix='sendsbot-bench-') as workdir:
+        os.chdir(workdir)
+        try:
+            print(
+                f"{'scenario':<16}{'groups':>8}{'admins':>8}{'messages':>9}{'updates':>9}"
+                f"{'us/update':>12}{'peak B/upd':>12}{'kept B/upd':>12}{'api calls':>11}"
+            )
+            for name in args.scenario:
+                for group_count, admin_count, message_count in itertools.product(args.groups, args.admins, args.messages):
+                    result = run_scenario(name, max(group_count, 1), max(admin_count, 1), message_count, args.updates)
+                    print(
+                        f"{result['scenario']:<16}{result['groups']:>8}{result['admins']:>8}"
+                        f"{result['messages']:>9}{result['updates']:>9}"
+                        f"{result['us_per_update']:>12.1f}{result['peak_bytes_per_update']:>12.0f}"
+                        f"{result['retained_bytes_per_update']:>12.0f}{result['api_calls']:>11}"
+                    )
+        finally:
+            os.chdir(original_cwd)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
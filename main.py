@@ -4,7 +4,7 @@ import logging
 import asyncio
 import base64
 from datetime import datetime
-from telegram import Update
+from telegram import MessageEntity, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
@@ -21,15 +21,108 @@ MESSAGES_FILE = 'messages.json'
 GROUPS_FILE = 'groups.json'
 ADMINS_FILE = 'admins.json'
 
+# Налаштування авто-розсилки
+AUTO_BROADCAST_INTERVAL = 60  # секунд між тіками
+SEND_DELAY = 0.5  # мінімальна пауза між відправками
+# Згладжене розсилання: відправки тіку розподіляються по вікну
+# AUTO_BROADCAST_INTERVAL * PACING_DUTY_CYCLE замість одного сплеску
+SMOOTH_PACING = True
+PACING_DUTY_CYCLE = 0.8
+# Дробова частина золотого перетину - зсуви груп рівномірні при будь-якій кількості груп
+GOLDEN_RATIO_FRACTION = 0.6180339887498949
+
+# Вікно понад інтервал наклалося б на наступний тік, і планувальник мовчки його пропустив би
+if not 0 < PACING_DUTY_CYCLE <= 1:
+    raise ValueError(f"PACING_DUTY_CYCLE має бути в межах (0, 1], отримано {PACING_DUTY_CYCLE}")
+
+# Ліміти Telegram (рахуються в одиницях UTF-16, як і зсуви entities)
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+# Короткий підпис до фото, коли повний текст іде окремим повідомленням
+CAPTION_PREVIEW_LIMIT = 200
+
+
+def format_interval(seconds):
+    """Інтервал авто-розсилки для повідомлень користувачу"""
+    if seconds == 60:
+        return "кожну хвилину"
+    if seconds % 60 == 0:
+        return f"кожні {seconds // 60} хв"
+    return f"кожні {seconds} с"
+
+
+def utf16_len(text):
+    """Довжина тексту в одиницях UTF-16"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_text(text, limit):
+    """Розбиття тексту на частини до limit одиниць UTF-16.
+
+    Повертає список (частина, початок, кінець) з межами в UTF-16.
+    Ріже по переносу рядка або пробілу, якщо вони в другій половині частини.
+    """
+    chunks = []
+    start = 0
+    start16 = 0
+
+    while start < len(text):
+        end = start
+        units = 0
+        while end < len(text):
+            char_units = 2 if ord(text[end]) > 0xFFFF else 1
+            if units + char_units > limit:
+                break
+            units += char_units
+            end += 1
+
+        if end < len(text):
+            middle = start + (end - start) // 2
+            cut = text.rfind('\n', middle, end)
+            if cut == -1:
+                cut = text.rfind(' ', middle, end)
+            if cut != -1:
+                end = cut + 1
+                units = utf16_len(text[start:end])
+
+        chunks.append((text[start:end], start16, start16 + units))
+        start = end
+        start16 += units
+
+    return chunks
+
+
+def slice_entities(entities, start16, end16):
+    """Entities, що потрапляють у відрізок [start16, end16), зі зсувом до його початку"""
+    result = []
+    for entity in entities:
+        begin = max(entity.offset, start16)
+        end = min(entity.offset + entity.length, end16)
+        if begin >= end:
+            continue
+        result.append(MessageEntity(
+            type=entity.type,
+            offset=begin - start16,
+            length=end - begin,
+            url=entity.url,
+            user=entity.user,
+            language=entity.language,
+            custom_emoji_id=entity.custom_emoji_id
+        ))
+    return result or None
+
+
 class SimpleBroadcastBot:
     def __init__(self, token):
         self.token = token
         self.application = Application.builder().token(token).build()
         self.scheduler = AsyncIOScheduler()
         self.setup_handlers()
+        self.send_plans = {}
         self.load_data()
         self.broadcast_in_progress = False
         self.auto_broadcast_active = False
+        self.auto_broadcast_run = 0
         self.current_message_index = 0
         
     def setup_handlers(self):
@@ -92,6 +185,11 @@ class SimpleBroadcastBot:
             self.messages = []
             self.groups = []
             self.admins = []
+        
+        # Плани відправки компілюються один раз при завантаженні
+        self.send_plans = {}
+        for message_data in self.messages:
+            self.get_send_plan(message_data)
             
     def save_data(self, data_type):
         """Збереження даних у файли"""
@@ -108,6 +206,107 @@ class SimpleBroadcastBot:
         except Exception as e:
             logger.error(f"Помилка збереження даних: {e}")
     
+    def load_photo(self, message_data):
+        """Байти фото повідомлення (base64 у JSON або файл з photos/)"""
+        if message_data.get('photo_base64'):
+            return base64.b64decode(message_data['photo_base64'])
+        photo_path = message_data.get('photo_path')
+        if photo_path and os.path.exists(photo_path):
+            with open(photo_path, 'rb') as f:
+                return f.read()
+        return None
+
+    def compile_send_plan(self, message_data):
+        """Компіляція повідомлення в план відправки.
+
+        План - список кроків {'method': ..., 'kwargs': ...}, які виконуються
+        для кожної групи без додаткових перевірок. Підпис до фото понад
+        CAPTION_LIMIT замінюється першим рядком (якщо він не довший за
+        CAPTION_PREVIEW_LIMIT), а повний текст іде окремими повідомленнями
+        до MESSAGE_LIMIT кожне. Помилки (фото, entities) пробрасуються.
+        """
+        text = message_data.get('text') or ''
+        entities = [
+            MessageEntity.de_json(entity, None)
+            for entity in message_data.get('entities') or []
+        ]
+        photo = self.load_photo(message_data) if message_data.get('has_photo') else None
+        text_length = utf16_len(text)
+
+        plan = []
+        if photo is not None:
+            if text_length <= CAPTION_LIMIT:
+                plan.append({
+                    'method': 'send_photo',
+                    'kwargs': {
+                        'photo': photo,
+                        'caption': text if text.strip() else None,
+                        'caption_entities': slice_entities(entities, 0, text_length)
+                    }
+                })
+                text = ''
+            else:
+                # Довгий перший рядок повторився б майже цілим у тексті нижче - тоді без підпису
+                caption = text.split('\n', 1)[0]
+                caption_end = utf16_len(caption)
+                if not caption.strip() or caption_end > CAPTION_PREVIEW_LIMIT:
+                    caption = ''
+                    caption_end = 0
+                plan.append({
+                    'method': 'send_photo',
+                    'kwargs': {
+                        'photo': photo,
+                        'caption': caption or None,
+                        'caption_entities': slice_entities(entities, 0, caption_end)
+                    }
+                })
+
+        if text:
+            for chunk, start16, end16 in split_text(text, MESSAGE_LIMIT):
+                # Telegram відхиляє порожній текст; межі решти частин від цього не змінюються
+                if not chunk.strip():
+                    continue
+                plan.append({
+                    'method': 'send_message',
+                    'kwargs': {
+                        'text': chunk,
+                        'entities': slice_entities(entities, start16, end16)
+                    }
+                })
+
+        # Ключ - сам об'єкт повідомлення: id в JSON можуть повторюватися після видалень
+        self.send_plans[id(message_data)] = (message_data, plan)
+        return plan
+
+    def get_send_plan(self, message_data):
+        """План відправки з кешу (компілюється, якщо його ще немає).
+
+        Для повідомлення, яке не вдалося скомпілювати, кешується і
+        повертається None, щоб розсилка пропускала його без повторних спроб.
+        """
+        cached = self.send_plans.get(id(message_data))
+        if cached and cached[0] is message_data:
+            return cached[1]
+        try:
+            return self.compile_send_plan(message_data)
+        except Exception as e:
+            logger.error(f"Помилка підготовки повідомлення {message_data.get('id')}: {e}")
+            self.send_plans[id(message_data)] = (message_data, None)
+            return None
+
+    async def send_plan(self, bot, chat_id, plan):
+        """Виконання плану відправки в одну групу"""
+        for step_index, step in enumerate(plan):
+            # Кроки одного плану йдуть в той самий чат - не перевищуємо ліміт на чат
+            if step_index:
+                await asyncio.sleep(SEND_DELAY)
+            
+            sent = await getattr(bot, step['method'])(chat_id=chat_id, **step['kwargs'])
+            
+            # Після першого завантаження фото шлемо його за file_id
+            if step['method'] == 'send_photo' and isinstance(step['kwargs']['photo'], bytes) and sent and sent.photo:
+                step['kwargs']['photo'] = sent.photo[-1].file_id
+
     def is_admin(self, user_id):
         """Перевірка, чи є користувач адміном"""
         try:
@@ -133,9 +332,11 @@ class SimpleBroadcastBot:
             return
             
         self.auto_broadcast_active = True
+        # Новий номер запуску: тік попереднього запуску, що ще йде, зупиниться
+        self.auto_broadcast_run += 1
         
-        # Додаємо завдання кожну хвилину
-        trigger = IntervalTrigger(minutes=1)
+        # Додаємо завдання з інтервалом AUTO_BROADCAST_INTERVAL
+        trigger = IntervalTrigger(seconds=AUTO_BROADCAST_INTERVAL)
         self.scheduler.add_job(
             self.single_auto_broadcast,
             trigger=trigger,
@@ -146,7 +347,7 @@ class SimpleBroadcastBot:
         if not self.scheduler.running:
             self.scheduler.start()
             
-        logger.info("⏰ Авто-розсилка запущена - кожну хвилину")
+        logger.info(f"⏰ Авто-розсилка запущена - {format_interval(AUTO_BROADCAST_INTERVAL)}")
 
     async def single_auto_broadcast(self):
         """Одна автоматична розсилка одного повідомлення"""
@@ -154,13 +355,26 @@ class SimpleBroadcastBot:
             if not self.auto_broadcast_active or not self.messages or not self.groups:
                 return
             
+            run = self.auto_broadcast_run
             bot = self.application.bot
             
             # Отримуємо поточне повідомлення
             if self.current_message_index >= len(self.messages):
                 self.current_message_index = 0
             
-            message_data = self.messages[self.current_message_index]
+            # Повідомлення без плану відправки пропускаємо, щоб черга не застрягла
+            plan = None
+            for _ in range(len(self.messages)):
+                message_data = self.messages[self.current_message_index]
+                plan = self.get_send_plan(message_data)
+                if plan:
+                    break
+                logger.error(f"⚠️ Повідомлення {message_data.get('id')} пропущено: його не вдалося підготувати")
+                self.current_message_index = (self.current_message_index + 1) % len(self.messages)
+            
+            if not plan:
+                logger.error("💥 Авто-розсилка: немає жодного повідомлення, яке можна відправити")
+                return
             
             success_count = 0
             total_groups = len(self.groups)
@@ -168,30 +382,23 @@ class SimpleBroadcastBot:
             logger.info(f"🤖 Авто-розсилка повідомлення {self.current_message_index + 1}/{len(self.messages)}")
             
             # Розсилаємо поточне повідомлення
-            for group in self.groups:
+            async for group in self.paced_groups(run):
                 try:
-                    if message_data.get('has_photo') and message_data.get('photo_base64'):
-                        # Декодуємо фото з base64
-                        photo_data = base64.b64decode(message_data['photo_base64'])
-                        
-                        await bot.send_photo(
-                            chat_id=group['chat_id'],
-                            photo=photo_data,
-                            caption=message_data['text']
-                        )
-                    else:
-                        await bot.send_message(
-                            chat_id=group['chat_id'],
-                            text=message_data['text']
-                        )
+                    await self.send_plan(bot, group['chat_id'], plan)
                     success_count += 1
                     
                     # Невелика затримка між відправками
-                    await asyncio.sleep(0.5)
+                    if not SMOOTH_PACING:
+                        await asyncio.sleep(SEND_DELAY)
                     
                 except Exception as e:
                     logger.error(f"❌ Помилка авто-відправки в групу {group['title']}: {e}")
             
+            # Повідомлення могли видалити під час тіку
+            if not self.messages:
+                logger.info(f"⏹️ Авто-розсилка перервана. Успішно: {success_count}/{total_groups}")
+                return
+            
             # Оновлюємо індекс для наступного повідомлення
             self.current_message_index = (self.current_message_index + 1) % len(self.messages)
             
@@ -200,6 +407,50 @@ class SimpleBroadcastBot:
         except Exception as e:
             logger.error(f"💥 Помилка в single_auto_broadcast: {e}")
 
+    def group_offset(self, group_index):
+        """Фіксований зсув групи у вікні розсилки (частка від 0 до 1)"""
+        return (group_index * GOLDEN_RATIO_FRACTION) % 1.0
+
+    def is_current_run(self, run):
+        """Чи тік належить поточному запуску авто-розсилки"""
+        return self.auto_broadcast_active and run == self.auto_broadcast_run
+
+    async def paced_groups(self, run):
+        """Видає групи тіку, чекаючи на зсув кожної у вікні розсилки"""
+        groups = list(self.groups)
+        if not SMOOTH_PACING:
+            for group in groups:
+                # /stop_auto і перезапуск не чекають завершення тіку
+                if not self.is_current_run(run):
+                    return
+                yield group
+            return
+
+        loop = asyncio.get_running_loop()
+        window = AUTO_BROADCAST_INTERVAL * PACING_DUTY_CYCLE
+        tick_start = loop.time()
+        last_send = None
+
+        # Групи додаються лише в кінець списку, тож індекс і зсув групи сталі
+        schedule = sorted(
+            ((self.group_offset(index) * window, group) for index, group in enumerate(groups)),
+            key=lambda item: item[0]
+        )
+
+        for offset, group in schedule:
+            send_at = tick_start + offset
+            if last_send is not None:
+                send_at = max(send_at, last_send + SEND_DELAY)
+            delay = send_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            # /stop_auto і перезапуск не чекають завершення тіку
+            if not self.is_current_run(run):
+                return
+            last_send = loop.time()
+            yield group
+
     async def start_auto(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Запуск автоматичної розсилки"""
         try:
@@ -234,7 +485,7 @@ class SimpleBroadcastBot:
                 f"📊 Статистика:\n"
                 f"• Повідомлень: {len(self.messages)}\n"
                 f"• Груп: {len(self.groups)}\n"
-                f"• Інтервал: кожну хвилину\n\n"
+                f"• Інтервал: {format_interval(AUTO_BROADCAST_INTERVAL)}\n\n"
                 f"🤖 Тепер бот автоматично розсилатиме повідомлення по черзі.\n"
                 f"⏹️ Зупинити: /stop_auto"
             )
@@ -318,7 +569,7 @@ class SimpleBroadcastBot:
                         "/list_messages - список повідомлень\n"
                         "/delete_message [id] - видалити повідомлення\n"
                         "/broadcast - зробити разову розсилку всіх повідомлень\n"
-                        "/start_auto - увімкнути авто-розсилку (кожну хвилину)\n"
+                        f"/start_auto - увімкнути авто-розсилку ({format_interval(AUTO_BROADCAST_INTERVAL)})\n"
                         "/stop_auto - вимкнути авто-розсилку\n"
                         "/add_admin [user_id] - додати адміна\n"
                         "/status - статус бота\n\n"
@@ -370,6 +621,7 @@ class SimpleBroadcastBot:
             if context.user_data.get('adding_message') and context.user_data.get('message_step') == 'text':
                 text = update.message.text
                 context.user_data['pending_text'] = text
+                context.user_data['pending_entities'] = [entity.to_dict() for entity in update.message.entities]
                 context.user_data['message_step'] = 'photo'
                 
                 await update.message.reply_text(
@@ -406,12 +658,15 @@ class SimpleBroadcastBot:
                 message_data = {
                     'id': len(self.messages) + 1,
                     'text': text,
+                    'entities': context.user_data.get('pending_entities', []),
                     'photo_base64': photo_base64,
                     'has_photo': True,
                     'created_date': datetime.now().isoformat(),
                     'created_by': user_id
                 }
                 
+                # План компілюється до збереження: повідомлення з помилкою не потрапить у розсилку
+                plan = self.compile_send_plan(message_data)
                 self.messages.append(message_data)
                 self.save_data('messages')
                 
@@ -419,12 +674,14 @@ class SimpleBroadcastBot:
                 context.user_data.pop('adding_message', None)
                 context.user_data.pop('message_step', None)
                 context.user_data.pop('pending_text', None)
+                context.user_data.pop('pending_entities', None)
                 
                 await update.message.reply_text(
                     f"✅ Повідомлення з фото додано!\n\n"
                     f"📝 Текст: {text}\n"
                     f"🖼️ Фото: додано\n"
-                    f"📊 ID: {message_data['id']}\n\n"
+                    f"📊 ID: {message_data['id']}\n"
+                    f"📨 Відправок на групу: {len(plan)}\n\n"
                     f"Тепер ви можете зробити розсилку командою /broadcast"
                 )
                 
@@ -452,12 +709,15 @@ class SimpleBroadcastBot:
                 message_data = {
                     'id': len(self.messages) + 1,
                     'text': text,
+                    'entities': context.user_data.get('pending_entities', []),
                     'photo_base64': None,
                     'has_photo': False,
                     'created_date': datetime.now().isoformat(),
                     'created_by': user_id
                 }
                 
+                # План компілюється до збереження: повідомлення з помилкою не потрапить у розсилку
+                plan = self.compile_send_plan(message_data)
                 self.messages.append(message_data)
                 self.save_data('messages')
                 
@@ -465,12 +725,14 @@ class SimpleBroadcastBot:
                 context.user_data.pop('adding_message', None)
                 context.user_data.pop('message_step', None)
                 context.user_data.pop('pending_text', None)
+                context.user_data.pop('pending_entities', None)
                 
                 await update.message.reply_text(
                     f"✅ Повідомлення додано (без фото)!\n\n"
                     f"📝 Текст: {text}\n"
                     f"🖼️ Фото: відсутнє\n"
-                    f"📊 ID: {message_data['id']}\n\n"
+                    f"📊 ID: {message_data['id']}\n"
+                    f"📨 Відправок на групу: {len(plan)}\n\n"
                     f"Тепер ви можете зробити розсилку командою /broadcast"
                 )
             else:
@@ -538,6 +800,7 @@ class SimpleBroadcastBot:
                 
                 if message_to_delete:
                     self.messages.remove(message_to_delete)
+                    self.send_plans.pop(id(message_to_delete), None)
                     self.save_data('messages')
                     await update.message.reply_text(f"✅ Повідомлення ID {message_id} видалено!")
                 else:
@@ -587,30 +850,21 @@ class SimpleBroadcastBot:
             # Розсилаємо всі повідомлення по черзі
             for message_index, message_data in enumerate(self.messages, 1):
                 message_success = 0
+                plan = self.get_send_plan(message_data)
                 
-                for group_index, group in enumerate(self.groups, 1):
-                    try:
-                        if message_data.get('has_photo') and message_data.get('photo_base64'):
-                            # Декодуємо фото з base64
-                            photo_data = base64.b64decode(message_data['photo_base64'])
+                if not plan:
+                    logger.error(f"⚠️ Повідомлення {message_index} пропущено: його не вдалося підготувати")
+                else:
+                    for group_index, group in enumerate(self.groups, 1):
+                        try:
+                            await self.send_plan(bot, group['chat_id'], plan)
+                            message_success += 1
+                            logger.info(f"✅ Повідомлення {message_index} відправлено в {group['title']} ({message_success}/{total_groups})")
+                            
+                            await asyncio.sleep(SEND_DELAY)
                             
-                            await bot.send_photo(
-                                chat_id=group['chat_id'],
-                                photo=photo_data,
-                                caption=message_data['text']
-                            )
-                        else:
-                            await bot.send_message(
-                                chat_id=group['chat_id'],
-                                text=message_data['text']
-                            )
-                        message_success += 1
-                        logger.info(f"✅ Повідомлення {message_index} відправлено в {group['title']} ({message_success}/{total_groups})")
-                        
-                        await asyncio.sleep(0.5)
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Помилка відправки в групу {group['title']}: {e}")
+                        except Exception as e:
+                            logger.error(f"❌ Помилка відправки в групу {group['title']}: {e}")
                 
                 success_count += message_success
                 
@@ -684,7 +938,7 @@ class SimpleBroadcastBot:
                 f"📊 Статус бота:\n\n"
                 f"🔄 Розсилка: {status_text}\n"
                 f"🤖 Авто-розсилка: {auto_status}\n"
-                f"⏱️ Інтервал: кожну хвилину\n"
+                f"⏱️ Інтервал: {format_interval(AUTO_BROADCAST_INTERVAL)}\n"
                 f"📝 Повідомлень: {len(self.messages)}\n"
                 f"🖼️ З фото: {messages_with_photo}\n"
                 f"📍 Поточне: {self.current_message_index + 1}/{len(self.messages)}\n"